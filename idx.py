@@ -1,16 +1,24 @@
 import os
+import re
+import json
+import hashlib
 import sqlite3
 import chromadb
+from chromadb.utils import embedding_functions
 import openai
+import httpx
+import faiss
+import numpy as np
 import asyncio
 import nest_asyncio
 import random
-import requests
+from array import array
+from functools import lru_cache
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
 
 # Apply nest_asyncio to allow async functions in synchronous contexts
 nest_asyncio.apply()
@@ -30,99 +38,354 @@ BROWSERBASE_PROJECT_ID = os.getenv("BROWSERBASE_PROJECT_ID", "ID") #paste id
 if not OPENROUTER_API_KEY:
     raise ValueError("ERROR: OpenRouter API key is missing. Set OPENROUTER_API_KEY properly.")
 
+# Shared async OpenRouter client so TLS and the connection pool are reused across requests
+# and streaming completions don't block the event loop
+_OPENAI_CLIENT = openai.AsyncOpenAI(
+    api_key=OPENROUTER_API_KEY,
+    base_url="https://openrouter.ai/api/v1",
+    http_client=httpx.AsyncClient(http2=True, limits=httpx.Limits(max_keepalive_connections=32)),
+)
+
+# Shared async HTTP client for Browserbase calls
+_HTTPX = httpx.AsyncClient(http2=True, timeout=10.0, headers={"Content-Type": "application/json"})
+
+# Heavy resources are opened lazily on first use (or warmed at startup) instead of at import
+
 # Connect to ChromaDB (update to supabase integration)
-chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-collection = chroma_client.get_collection("documents")
+# the embedder is explicit so query vectors can be computed (and cached) outside of collection.query
+_EMBEDDER = embedding_functions.DefaultEmbeddingFunction()
+
+@lru_cache(maxsize=None)
+def _chroma_client():
+    return chromadb.PersistentClient(path=CHROMA_DB_PATH)
+
+@lru_cache(maxsize=None)
+def _collection():
+    return _chroma_client().get_collection("documents", embedding_function=_EMBEDDER)
+
+# In-memory FAISS index over the documents collection when it is small enough;
+# chromadb stays the write path and the fallback for larger corpora
+FAISS_MAX_DOCS = 100_000
+
+def build_faiss_index(collection):
+    """Loads the collection's embeddings into an int8 scalar-quantized inner-product index.
+    Returns (index, documents)."""
+    if collection.count() > FAISS_MAX_DOCS:
+        return None, []
+    vecs = collection.get(include=["embeddings", "documents"])
+    if not vecs["documents"]:
+        return None, []
+    matrix = np.asarray(vecs["embeddings"], dtype=np.float32)
+    faiss.normalize_L2(matrix)  # inner product on unit vectors == cosine similarity
+    # 8-bit codes are a quarter of the fp32 footprint; training only learns the per-dimension ranges
+    index = faiss.IndexScalarQuantizer(matrix.shape[1], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    index.train(matrix)
+    index.add(matrix)
+    return index, vecs["documents"]
+
+@lru_cache(maxsize=None)
+def _faiss_index():
+    return build_faiss_index(_collection())
+
+def ain_hash(apn):
+    """Packs an APN into a signed 64-bit int (first 8 bytes of its sha256)."""
+    return int.from_bytes(hashlib.sha256(apn.encode()).digest()[:8], "big", signed=True)
+
+@lru_cache(maxsize=None)
+def _conn():
+    """Connects to SQLite once, runs the schema setup and reuses the handle across requests."""
+    # (larger statement cache so the /batch WITH req(apn) AS (VALUES ...) joins, one per chunk size,
+    # stay prepared next to PARCEL_SQL and PARCEL_AIN_SQL)
+    conn = sqlite3.connect(SQLITE_DB_PATH, check_same_thread=False, cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    conn.create_function("ain_hash", 1, lambda ain: ain_hash(str(ain)) if ain is not None else None, deterministic=True)
+    conn.executescript("""
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA cache_size=-65536;
+        PRAGMA mmap_size=268435456;
+        CREATE INDEX IF NOT EXISTS idx_final_combined_ain ON final_combined(AIN);
+    """)
+
+    # add and backfill the integer hash key for AIN lookups (one-time migration)
+    if "ain_hash" not in {row["name"] for row in conn.execute("PRAGMA table_info(final_combined)")}:
+        conn.execute("ALTER TABLE final_combined ADD COLUMN ain_hash INTEGER")
+    with conn:
+        conn.execute("UPDATE final_combined SET ain_hash = ain_hash(AIN) WHERE ain_hash IS NULL")
+
+    # covering index so lookups are an integer compare and never touch the table pages
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_final_combined_ain_hash ON final_combined(
+            ain_hash, AIN, SitusFullA, TaxRateAre, SQFTmain1, LegalDescr, FLD_ZONE,
+            ZONE_SUBTY, NAME, PLNG_AREA, TITLE_22, Zone_Type_1, Zone_Type_2, Zone_Type_3, Zone_Type_4, Zone_Type_5, Seismic_Quadrangle
+        )
+    """)
+
+    # sidecar table so query embeddings survive restarts
+    conn.execute("CREATE TABLE IF NOT EXISTS query_embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+
+    # generated explanations keyed on the parcel's zoning profile (exact match, so no embedding needed)
+    conn.execute("CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, explanation TEXT NOT NULL)")
+
+    #log the plan once so a missing index shows up at startup rather than as slow lookups
+    for step in conn.execute("EXPLAIN QUERY PLAN " + PARCEL_SQL, (0, "")):
+        print("Parcel lookup plan:", step["detail"])
+    return conn
 
 # FastAPI setup
 app = FastAPI()
 
+@app.on_event("startup")
+async def warm_data_stores():
+    # sqlite and chroma/faiss load in parallel worker threads so the event loop stays free
+    await asyncio.gather(
+        asyncio.to_thread(_conn),
+        asyncio.to_thread(_faiss_index),
+    )
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await _HTTPX.aclose()
+    await _OPENAI_CLIENT.close()
+
 class APNRequest(BaseModel):
     apn: str
 
-# Database Search Functions
+class APNBatchRequest(BaseModel):
+    apns: list[str]
 
-def parcel_local_search(apn):
-    """Search SQLite database for property details."""
-    conn = sqlite3.connect(SQLITE_DB_PATH)
-    cursor = conn.cursor()
-
-    #specify column order
-    cursor.execute("""
-        SELECT AIN, SitusFullA, TaxRateAre, SQFTmain1, LegalDescr, FLD_ZONE, 
-               ZONE_SUBTY, NAME, PLNG_AREA, TITLE_22, Zone_Type_1, Zone_Type_2, Zone_Type_3, Zone_Type_4, Zone_Type_5, Seismic_Quadrangle 
-        FROM final_combined WHERE AIN=?
-    """, (apn,))
-    
-    result = cursor.fetchone()
-    conn.close()
+# Database Search Functions
 
-    #col list
-    columns = ["AIN", "SitusFullA", "TaxRateAre", "SQFTmain1", "LegalDescr", "FLD_ZONE",
-               "ZONE_SUBTY", "NAME", "PLNG_AREA", "TITLE_22", 
-               "Zone_Type_1", "Zone_Type_2", "Zone_Type_3", "Zone_Type_4", "Zone_Type_5", "Seismic_Quadrangle"]
+#specify column order (kept constant so sqlite's statement cache reuses the plan)
+PARCEL_COLUMNS = """AIN, SitusFullA, TaxRateAre, SQFTmain1, LegalDescr, FLD_ZONE,
+           ZONE_SUBTY, NAME, PLNG_AREA, TITLE_22, Zone_Type_1, Zone_Type_2, Zone_Type_3, Zone_Type_4, Zone_Type_5, Seismic_Quadrangle"""
+PARCEL_SELECT = f"""
+    SELECT {PARCEL_COLUMNS}
+    FROM final_combined"""
+PARCEL_SQL = PARCEL_SELECT + " WHERE ain_hash=? AND AIN=?"
+#plain AIN lookup (idx_final_combined_ain) for rows the hash can't find: numeric AINs that only match via
+#type affinity (e.g. '0123' vs 123) and rows added since startup whose ain_hash hasn't been backfilled
+PARCEL_AIN_SQL = PARCEL_SELECT + " WHERE AIN=?"
+
+#stay well under sqlite's bound-parameter limit for batch lookups
+BATCH_CHUNK_SIZE = 500
+#max LLM explanations generated at once for a /batch request
+BATCH_LLM_CONCURRENCY = 5
+
+def _fetch_parcel(apn):
+    #AIN is still compared to rule out hash collisions
+    conn = _conn()
+    result = conn.execute(PARCEL_SQL, (ain_hash(apn), apn)).fetchone()
+    if result is None:
+        result = conn.execute(PARCEL_AIN_SQL, (apn,)).fetchone()
+    return result
 
-    #ensure result not None before zip
-    return dict(zip(columns, result)) if result else None
+async def parcel_local_search(apn):
+    """Search SQLite database for property details."""
+    #runs in a worker thread to keep the event loop free
+    result = await asyncio.to_thread(_fetch_parcel, apn)
+
+    #rows come back as sqlite3.Row, only convert to dict at the api boundary
+    return dict(result) if result else None
+
+@lru_cache(maxsize=2048)
+def _embed(query):
+    """Embeds a query, checking the persisted sqlite cache before calling the embedder."""
+    key = hashlib.sha256(query.encode()).hexdigest()
+    row = _conn().execute("SELECT vector FROM query_embeddings WHERE key=?", (key,)).fetchone()
+    if row:
+        return array("f", row["vector"]).tolist()
+
+    vector = [float(x) for x in _EMBEDDER([query])[0]]
+    # persisting is best effort (read-only db, SQLITE_BUSY with several workers); the vector is still good
+    try:
+        with _conn():
+            _conn().execute("INSERT OR REPLACE INTO query_embeddings (key, vector) VALUES (?, ?)",
+                            (key, array("f", vector).tobytes()))
+    except sqlite3.Error as e:
+        print(f"Error saving query embedding: {e}")
+    return vector
+
+def normalize_query(query):
+    """Lowercases and strips punctuation so near-identical addresses share a cache entry."""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+@lru_cache(maxsize=4096)
+def _retrieve_context_cached(query):
+    # exceptions propagate so failed lookups are never cached
+    index, docs = _faiss_index()
+    if index is not None:
+        q = np.asarray([_embed(query)], dtype=np.float32)
+        faiss.normalize_L2(q)
+        _, ids = index.search(q, 3)
+        return "\n".join(docs[i] for i in ids[0] if i != -1)
+
+    results = _collection().query(query_embeddings=[_embed(query)], n_results=3)
+    if results and "documents" in results and results["documents"]:
+        return "\n".join(results["documents"][0])
+    else:
+        return "No relevant documents found."
 
-def retrieve_context(query):
+def _search_context(query):
     """Retrieve top 3 most relevant text chunks from ChromaDB.""" #update chunking
     try:
-        results = collection.query(query_texts=[query], n_results=3)
-        if results and "documents" in results and results["documents"]:
-            return "\n".join(results["documents"][0])
-        else:
-            return "No relevant documents found."
+        return _retrieve_context_cached(normalize_query(query))
     except Exception as e:
         print(f"Error retrieving context from ChromaDB: {e}")
         return "Error retrieving context."
 
-def call_gemini_flash(parcel_data, context):
-    
-    system_prompt = """
-    I want a breakdown of the zoning for any given property API. The summary should highlight the current zoning code the property falls under and break down every possible use of the property from the current zoning regulations. The breakdown should also include earthquake and flood zones.
+def _fetch_parcels(apns):
+    #joining on the requested values (instead of AIN IN (...)) returns which input APN each row matched;
+    #AIN=req.apn compares with the same type affinity as the single lookup and uses idx_final_combined_ain
+    rows = []
+    for i in range(0, len(apns), BATCH_CHUNK_SIZE):
+        chunk = apns[i:i + BATCH_CHUNK_SIZE]
+        values = ",".join(["(?)"] * len(chunk))
+        rows.extend(_conn().execute(f"""
+            WITH req(apn) AS (VALUES {values})
+            SELECT req.apn AS requested_apn, {PARCEL_COLUMNS}
+            FROM req JOIN final_combined ON final_combined.AIN = req.apn
+        """, chunk).fetchall())
+    return rows
+
+async def parcel_batch_search(apns):
+    """Search SQLite for several APNs with one query. Returns {requested APN: property details}."""
+    rows = await asyncio.to_thread(_fetch_parcels, list(dict.fromkeys(apns)))
+    found = {}
+    for row in rows:
+        parcel_data = dict(row)
+        found.setdefault(parcel_data.pop("requested_apn"), parcel_data)
+    return found
+
+async def retrieve_context(query):
+    """Runs the context search in a worker thread so it can overlap with other work."""
+    return await asyncio.to_thread(_search_context, query)
+
+# LLM prompt
+# static text goes first and stays byte-identical between calls so the provider's prefix cache can hit;
+# everything request specific is appended at the very end of the user message.
+# the LLM only gets the parcel's zoning profile (see ZONING_PROFILE_FIELDS), not its address, APN, square footage
+# or legal description: explanations are cached per zoning profile and served to other parcels, so they must not
+# mention anything parcel specific. explain_parcel prepends those fields itself as a locally built summary.
+
+SYSTEM_PROMPT = """
+I want a breakdown of the zoning for any given property API. The summary should highlight the current zoning code the property falls under and break down every possible use of the property from the current zoning regulations. The breakdown should also include earthquake and flood zones.
 
 For the zoning uses of the API, return them in a list format, not in paragraph format. It should site the zoning code that it falls under, then break down the regulations that fall under that code. The same should be done for the earthquake and flood zones. If there are any historic preservation over zones, include a link to the corresponding page to that zone. If there is a hillside ordinance, include the link to the corresponding ordinance.
 
 Be careful not to include codes that do not exist. Only include codes that do exist.
 
-For context, I want a zoning summary that can be used to assist real estate appraisers so that they do not have to search through the zoning code themselves. This report should be in-depth enough so that a licensed appraiser can use this summary to complete their reports and save them time. """
+For context, I want a zoning summary that can be used to assist real estate appraisers so that they do not have to search through the zoning code themselves. This report should be in-depth enough so that a licensed appraiser can use this summary to complete their reports and save them time.
+""".strip()
 
-    user_prompt = f"""
-    Property Details:
-    {parcel_data}
+STATIC_INSTRUCTIONS = """
+Explain the zoning details, flood risk, tax rate area, and any relevant regulations based on the retrieved information.
+""".strip()
 
-    Relevant Documents:
-    {context}
+async def call_gemini_flash(profile, context):
+    """Streams the explanation text from the LLM as it is generated.
+    Takes the zoning profile rather than the full parcel record so the output is safe to cache."""
+    # relevant documents first, property details last since they differ on every request
+    property_details = json.dumps(profile, sort_keys=True, default=str)
+    user_prompt = f"""{STATIC_INSTRUCTIONS}
 
-    Explain the zoning details, flood risk, tax rate area, and any relevant regulations based on the retrieved information.
-    """
+---
+Relevant Documents:
+{context}
 
-    client = openai.OpenAI(
-        api_key=OPENROUTER_API_KEY,
-        base_url="https://openrouter.ai/api/v1"  
-    )
+Property Details:
+{property_details}
+"""
 
-    response = client.chat.completions.create(
+    stream = await _OPENAI_CLIENT.chat.completions.create(
         model="google/gemini-pro",  # Updated model name
         messages=[
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": user_prompt}
-        ]
+        ],
+        extra_body={"prompt_cache_key": "parcel_zoning_v1"},
+        stream=True,
+    )
+
+    async for chunk in stream:
+        if chunk.choices:
+            yield chunk.choices[0].delta.content or ""
+
+# only these fields go to the LLM and into the cache key, so a cached explanation never carries
+# another parcel's address or APN
+ZONING_PROFILE_FIELDS = ["Zone_Type_1", "Zone_Type_2", "Zone_Type_3", "Zone_Type_4", "Zone_Type_5", "TITLE_22",
+                         "FLD_ZONE", "ZONE_SUBTY", "NAME", "PLNG_AREA", "TaxRateAre", "Seismic_Quadrangle"]
+
+def zoning_profile(parcel_data):
+    """Returns the parcel fields the explanation depends on, without anything identifying the parcel."""
+    return {field: parcel_data.get(field) for field in ZONING_PROFILE_FIELDS}
+
+def response_cache_key(profile):
+    """Exact cache id: parcels with the same zoning profile share an explanation."""
+    return hashlib.sha256(json.dumps(profile, sort_keys=True, default=str).encode()).hexdigest()
+
+def _read_cached_response(key):
+    row = _conn().execute("SELECT explanation FROM response_cache WHERE key=?", (key,)).fetchone()
+    return row["explanation"] if row else None
+
+def _write_cached_response(key, explanation):
+    with _conn():
+        _conn().execute("INSERT OR REPLACE INTO response_cache (key, explanation) VALUES (?, ?)", (key, explanation))
+
+def parcel_summary(parcel_data):
+    """Builds the parcel specific header locally so it is never served from the cache."""
+    return (
+        "Parcel summary:\n"
+        f"- Address: {parcel_data.get('SitusFullA') or 'Not available'}\n"
+        f"- APN: {parcel_data.get('AIN') or 'Not available'}\n"
+        f"- Main building square footage: {parcel_data.get('SQFTmain1') or 'Not available'}\n"
+        f"- Legal description: {parcel_data.get('LegalDescr') or 'Not available'}\n\n"
     )
 
-    return response.choices[0].message.content
+async def explain_parcel(parcel_data, context):
+    """Yields the parcel summary (address, APN, square footage, legal description, built locally),
+    then a cached explanation for the same zoning profile, else streams the LLM's."""
+    yield parcel_summary(parcel_data)
+
+    profile = zoning_profile(parcel_data)
+    key = response_cache_key(profile)
+    try:
+        cached = await asyncio.to_thread(_read_cached_response, key)
+        if cached is not None:
+            print("Response cache hit.")
+            yield cached
+            return
+    except Exception as e:
+        print(f"Error reading response cache: {e}")
+
+    parts = []
+    async for delta in call_gemini_flash(profile, context):
+        parts.append(delta)
+        yield delta
+    explanation = "".join(parts)
+
+    try:
+        await asyncio.to_thread(_write_cached_response, key, explanation)
+    except Exception as e:
+        print(f"Error writing response cache: {e}")
 
 #Web Scraper Functions
 
+# parcel report selectors, built once instead of per scrape
+ZONE_CELL_XPATH = "xpath=.//td[contains(., 'Zone(s):')]"
+FLOOD_HAZARD_XPATH = "xpath=.//td[contains(., 'Flood Hazard Zone:')]/following-sibling::td[1]"
+
+USER_AGENTS = ( #insert user agents
+
+)
+_UA_N = len(USER_AGENTS)
+_randrange = random.randrange
+
 def get_random_user_agent():
     """Returns a random User-Agent string."""
-    user_agents = [ #insert user agents 
-        
-    ]
-    return random.choice(user_agents)
+    return USER_AGENTS[_randrange(_UA_N)]
 
-async def random_delay(min_time=3, max_time=6):
+async def random_delay(min_time=0.2, max_time=0.5):
     """Adds a random delay between actions."""
     delay = random.uniform(min_time, max_time)
     print(f"Sleeping for {delay:.2f} seconds...")
@@ -130,19 +393,19 @@ async def random_delay(min_time=3, max_time=6):
 
 async def random_scroll(page):
     """Scrolls randomly on the page."""
-    scroll_height = await page.evaluate("document.body.scrollHeight")
-    scroll_position = random.randint(0, scroll_height)
-    await page.evaluate(f"window.scrollTo(0, {scroll_position});")
+    # pick and apply the position in the browser so it's a single CDP round trip
+    scroll_position = await page.evaluate(
+        "() => { const y = Math.floor(Math.random() * document.body.scrollHeight); window.scrollTo(0, y); return y; }"
+    )
     print(f"Scrolled to position: {scroll_position}")
-    await random_delay(1, 3)
+    await random_delay()
 
-def create_browserbase_session(api_key, project_id):
+async def create_browserbase_session(api_key, project_id):
     """Creates new Browserbase session."""
     url = "https://api.browserbase.com/v1/sessions"
-    headers = {"Content-Type": "application/json", "x-bb-api-key": api_key}
     payload = {"projectId": project_id, "proxies": True}
 
-    response = requests.post(url, headers=headers, json=payload)
+    response = await _HTTPX.post(url, headers={"x-bb-api-key": api_key}, json=payload)
     if response.status_code in [200, 201]:
         print("Session created successfully.")
         return response.json()
@@ -150,152 +413,210 @@ def create_browserbase_session(api_key, project_id):
         print(f"Failed to create session: {response.status_code} - {response.text}")
         return None
 
-async def scrape_and_extract_zones(apn, connect_url):
-    """Scrapes zone information and extracts zones and flood hazard using Playwright with Browserbase."""
-    async with async_playwright() as p:
-        # connect to Browserbase
-        browser = await p.chromium.connect_over_cdp(connect_url)
-        context = await browser.new_context(
-            user_agent=get_random_user_agent(),
-            viewport={"width": 1920, "height": 1080},
-        )
-        page = await context.new_page()
+async def scrape_and_extract_zones(apn, browser):
+    """Scrapes zone information and extracts zones and flood hazard using Playwright with Browserbase.
+    Runs in its own context on an already connected browser, so callers can share one browser."""
+    context = await browser.new_context(
+        user_agent=get_random_user_agent(),
+        viewport={"width": 1920, "height": 1080},
+    )
+    page = await context.new_page()
 
+    try:
+        # step 1: scrape the parcel profile report link
+        print("Navigating to LADBS Atlas...")
+        await page.goto("https://ladbs.org/atlas/", timeout=15000)
+        print("Page title:", await page.title())
+
+        if "Service unavailable" in await page.title():
+            print("Page returned 'Service unavailable'.")
+            return {"error": "Service unavailable"}
+
+        # locate the iframe
+        print("Waiting for iframe...")
+        iframe = page.frame(url="https://experience.arcgis.com/experience/31c73214b7034356a3cd4903bab233f7/page/Page")
+        if iframe is None:
+            raise Exception("Iframe not found.")
+        print("Iframe found!")
+
+        # handle acknowledgment box
         try:
-            # step 1: scrape the parcel profile report link
-            print("Navigating to LADBS Atlas...")
-            await page.goto("https://ladbs.org/atlas/", timeout=60000)
-            print("Page title:", await page.title())
-
-            if "Service unavailable" in await page.title():
-                print("Page returned 'Service unavailable'.")
-                return {"error": "Service unavailable"}
-
-            # locate the iframe
-            print("Waiting for iframe...")
-            iframe = page.frame(url="https://experience.arcgis.com/experience/31c73214b7034356a3cd4903bab233f7/page/Page")
-            if iframe is None:
-                raise Exception("Iframe not found.")
-            print("Iframe found!")
-
-            # handle acknowledgment box
-            try:
-                acknowledgment = iframe.locator("#jimu-link-app-2 > span.touch-ripple-root")
-                await acknowledgment.wait_for(state="visible", timeout=60000)
-                await acknowledgment.click()
-                print("Acknowledgment clicked.")
-            except Exception as e:
-                print("Acknowledgment box not found or already dismissed:", e)
-
-            # interact with the search box
-            search_box = iframe.locator("input[placeholder*='Search by Address']")
-            await search_box.fill(apn)
-            print(f"APN {apn} entered.")
-            await search_box.press("Enter")
-            print("Enter key pressed.")
-            await random_delay()
-
-            # wait for the calcite-flow-item to appear
-            print("Waiting for calcite-flow-item...")
-            await iframe.locator("calcite-flow-item").wait_for(state="attached", timeout=60000)
-            await iframe.locator("calcite-flow-item").scroll_into_view_if_needed()
-            await iframe.locator("calcite-flow-item").wait_for(state="visible", timeout=60000)
-            print("calcite-flow-item located.")
-
-            # wait for the "Complete Parcel Profile Report" link to be visible
-            print("Waiting for the parcel report link...")
-            parcel_report_link = iframe.locator("calcite-flow-item a[href*='ParcelProfileDetail2']")
-            await parcel_report_link.wait_for(state="visible", timeout=60000)
-            print("Parcel report link found.")
-
-            # get and clean the href attribute
-            href = await parcel_report_link.get_attribute("href")
-            href_cleaned = href.replace(" ", "")  # Remove all spaces
-            print(f"Cleaned Parcel report link: {href_cleaned}")
-
-            # step 2: extract zones and flood hazard
-            print(f"Navigating to {href_cleaned}...")
-            await page.goto(href_cleaned, timeout=90000)
-            print("Page title:", await page.title())
-
-            # ensure the page is fully loaded
-            await page.wait_for_load_state("networkidle")
-            print("Page fully loaded.")
-
-            # extract page source and parse with BeautifulSoup
-            content = await page.content()
-            soup = BeautifulSoup(content, 'html.parser')
-
-            # find the table with id 'basic'
-            table = soup.find("table", id="basic")
-            if not table:
-                raise Exception("Table with id 'basic' not found")
-
-            # extract zones dynamically
-            zones = []
-            zone_cell = table.find(lambda tag: tag.name == "td" and "Zone(s):" in tag.get_text())
-            if zone_cell:
-                # get the rowspan value (if it exists) or default to 1
-                rowspan = int(zone_cell.get('rowspan', 1))
-
-                # get the first zone from the current row
-                current_row = zone_cell.find_parent("tr")
-                zone_value_cell = current_row.find_all("td")[-1]
-                if zone_value_cell:
-                    zones.append(zone_value_cell.get_text(strip=True))
-
-                # get other zones from following rows
-                for _ in range(rowspan - 1):  # -1 because we already got the first zone
-                    current_row = current_row.find_next_sibling("tr")
-                    if current_row:
-                        zone_value_cell = current_row.find("td")
-                        if zone_value_cell:
-                            zones.append(zone_value_cell.get_text(strip=True))
-
-            print("All zones extracted:", zones)
-
-            # extract flood hazard zone
-            flood_hazard_cell = None
-            for td in table.find_all("td"):
-                if "Flood Hazard Zone:" in td.get_text(strip=True):
-                    flood_hazard_cell = td
-                    break
-
-            if flood_hazard_cell:
-                flood_hazard_zone = flood_hazard_cell.find_next_sibling("td").get_text(strip=True)
-            else:
-                flood_hazard_zone = "Not Found"
-
-            print("Flood hazard zone extracted:", flood_hazard_zone)
-
-            result = {
-                "apn": apn,
-                "link": href_cleaned,
-                "zones": zones,
-                "flood_hazard_zone": flood_hazard_zone,
-            }
-            return result
-
+            acknowledgment = iframe.locator("#jimu-link-app-2 > span.touch-ripple-root")
+            await acknowledgment.wait_for(state="visible", timeout=15000)
+            await acknowledgment.click()
+            print("Acknowledgment clicked.")
         except Exception as e:
-            print(f"Error: {str(e)}")
-            # debug: save a screenshot of the current page
-            await page.screenshot(path="error_debug_combined.png")
-            return {"error": str(e)}
+            print("Acknowledgment box not found or already dismissed:", e)
+
+        # interact with the search box
+        search_box = iframe.locator("input[placeholder*='Search by Address']")
+        await search_box.fill(apn)
+        print(f"APN {apn} entered.")
+        await search_box.press("Enter")
+        print("Enter key pressed.")
+
+        # wait for the calcite-flow-item to appear
+        print("Waiting for calcite-flow-item...")
+        await iframe.locator("calcite-flow-item").wait_for(state="attached", timeout=15000)
+        await iframe.locator("calcite-flow-item").scroll_into_view_if_needed()
+        await iframe.locator("calcite-flow-item").wait_for(state="visible", timeout=15000)
+        print("calcite-flow-item located.")
+
+        # wait for the "Complete Parcel Profile Report" link to be visible
+        print("Waiting for the parcel report link...")
+        parcel_report_link = iframe.locator("calcite-flow-item a[href*='ParcelProfileDetail2']")
+        await parcel_report_link.wait_for(state="visible", timeout=15000)
+        print("Parcel report link found.")
+
+        # get and clean the href attribute
+        href = await parcel_report_link.get_attribute("href")
+        href_cleaned = href.replace(" ", "")  # Remove all spaces
+        print(f"Cleaned Parcel report link: {href_cleaned}")
+
+        # step 2: extract zones and flood hazard
+        print(f"Navigating to {href_cleaned}...")
+        await page.goto(href_cleaned, timeout=30000)
+        print("Page title:", await page.title())
+
+        # wait only for the table we parse rather than for the network to go idle
+        await page.wait_for_selector("table#basic", state="attached", timeout=30000)
+        print("Parcel table loaded.")
+
+        # query the table with playwright locators in the browser instead of parsing the page in python
+        table = page.locator("table#basic")
+
+        # extract zones dynamically
+        zones = []
+        zone_cell = table.locator(ZONE_CELL_XPATH).first
+        if await zone_cell.count():
+            # get the rowspan value (if it exists) or default to 1
+            rowspan = int(await zone_cell.get_attribute("rowspan") or 1)
+
+            # get the first zone from the current row
+            current_row = zone_cell.locator("xpath=ancestor::tr[1]")
+            zones.append((await current_row.locator("xpath=td[last()]").text_content()).strip())
+
+            # get other zones from the first cell of the following rows (-1 because we already got the first zone)
+            other_zones = current_row.locator(f"xpath=following-sibling::tr[position() < {rowspan}]/td[1]")
+            zones.extend(text.strip() for text in await other_zones.all_text_contents())
+
+        print("All zones extracted:", zones)
+
+        # extract flood hazard zone
+        flood_hazard_cell = table.locator(FLOOD_HAZARD_XPATH).first
+        if await flood_hazard_cell.count():
+            flood_hazard_zone = (await flood_hazard_cell.text_content()).strip()
+        else:
+            flood_hazard_zone = "Not Found"
 
-        finally:
-            await browser.close()
+        print("Flood hazard zone extracted:", flood_hazard_zone)
+
+        result = {
+            "apn": apn,
+            "link": href_cleaned,
+            "zones": zones,
+            "flood_hazard_zone": flood_hazard_zone,
+        }
+        return result
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        # debug: save a screenshot of the current page (apn comes from the request, keep it to a safe filename)
+        try:
+            safe_apn = re.sub(r"[^\w-]", "_", apn)
+            await page.screenshot(path=f"error_debug_{safe_apn}.png")
+        except Exception as screenshot_error:
+            print(f"Could not save debug screenshot: {screenshot_error}")
+        return {"error": str(e)}
+
+    finally:
+        await context.close()
+
+# Browser pool: Browserbase browsers connected at startup and reused across requests
+BROWSER_POOL_SIZE = 2
+_BROWSER_POOL = asyncio.Queue(maxsize=BROWSER_POOL_SIZE)
+_PLAYWRIGHT = None
+
+async def connect_browser():
+    """Creates a Browserbase session and connects to it over CDP. Returns None if the session fails."""
+    session = await create_browserbase_session(BROWSERBASE_API_KEY, BROWSERBASE_PROJECT_ID)
+    if not session:
+        return None
+    return await _PLAYWRIGHT.chromium.connect_over_cdp(session["connectUrl"])
+
+async def acquire_browser():
+    """Takes a live browser from the pool, connecting a new one if the pool is empty."""
+    while not _BROWSER_POOL.empty():
+        browser = _BROWSER_POOL.get_nowait()
+        if browser.is_connected():
+            return browser
+        # the Browserbase session expired while idle
+        await browser.close()
+    return await connect_browser()
+
+async def release_browser(browser):
+    """Returns a browser to the pool, or closes it if the pool is full or it disconnected."""
+    if browser.is_connected() and not _BROWSER_POOL.full():
+        _BROWSER_POOL.put_nowait(browser)
+    else:
+        await browser.close()
+
+@app.on_event("startup")
+async def warm_browser_pool():
+    global _PLAYWRIGHT
+    _PLAYWRIGHT = await async_playwright().start()
+    # Browserbase being down must not stop the app from serving database lookups;
+    # acquire_browser connects on demand if the pool ends up smaller
+    for _ in range(BROWSER_POOL_SIZE):
+        try:
+            browser = await connect_browser()
+        except Exception as e:
+            print(f"Error warming browser pool: {e}")
+            continue
+        if browser:
+            _BROWSER_POOL.put_nowait(browser)
+    print(f"Browser pool warmed with {_BROWSER_POOL.qsize()} browser(s).")
+
+@app.on_event("shutdown")
+async def close_browser_pool():
+    while not _BROWSER_POOL.empty():
+        await _BROWSER_POOL.get_nowait().close()
+    if _PLAYWRIGHT:
+        await _PLAYWRIGHT.stop()
 
 async def get_web_scraped_data(apn):
     """Main function to handle web scraping for an APN."""
-    # create a Browserbase session
-    session = create_browserbase_session(BROWSERBASE_API_KEY, BROWSERBASE_PROJECT_ID)
-    
-    if not session:
+    browser = await acquire_browser()
+
+    if not browser:
         return {"error": "Failed to create Browserbase session"}
-    
-    connect_url = session["connectUrl"]
-    result = await scrape_and_extract_zones(apn, connect_url)
-    return result
+
+    try:
+        return await scrape_and_extract_zones(apn, browser)
+    finally:
+        await release_browser(browser)
+
+async def scrape_batch(apns, max_concurrency=5):
+    """Scrapes several APNs over one pooled browser, at most max_concurrency at a time."""
+    browser = await acquire_browser()
+
+    if not browser:
+        return [{"error": "Failed to create Browserbase session"} for _ in apns]
+
+    sem = asyncio.Semaphore(max_concurrency)
+
+    async def bounded(apn):
+        async with sem:
+            try:
+                return await scrape_and_extract_zones(apn, browser)
+            except Exception as e:
+                print(f"Error scraping APN {apn}: {e}")
+                return {"error": str(e)}
+
+    try:
+        return await asyncio.gather(*(bounded(apn) for apn in apns))
+    finally:
+        await release_browser(browser)
 
 # api endpoints
 
@@ -305,20 +626,28 @@ async def get_parcel_details_and_explanation(request: APNRequest):
     Falls back to web scraping if the APN is not found in the database."""
     
     # first try to get data from the database
-    parcel_data = parcel_local_search(request.apn)
+    parcel_data = await parcel_local_search(request.apn)
 
     if parcel_data:
-        # database search successful, proceed with the original flow
+        # database search successful, start retrieving context right away
         query_text = f"Zoning and regulations for {parcel_data.get('SitusFullA', 'this area')}"
-        context = retrieve_context(query_text)
-        explanation = call_gemini_flash(parcel_data, context)
-
-        return {
-            "parcel_data": parcel_data,
-            "context": context,
-            "explanation": explanation,
-            "source": "database"
-        }
+        context_task = asyncio.create_task(retrieve_context(query_text))
+
+        # stream as ndjson: parcel data as soon as we have it, then the context, then one line per explanation chunk
+        async def body():
+            yield json.dumps({"parcel_data": parcel_data, "source": "database"}, default=str) + "\n"
+            context = await context_task
+            yield json.dumps({"context": context}) + "\n"
+            # headers are already sent, so a failure mid-stream is reported as a final error line
+            try:
+                async for delta in explain_parcel(parcel_data, context):
+                    if delta:
+                        yield json.dumps({"explanation": delta}) + "\n"
+            except Exception as e:
+                print(f"Error generating explanation: {e}")
+                yield json.dumps({"error": f"Error generating explanation: {e}"}) + "\n"
+
+        return StreamingResponse(body(), media_type="application/x-ndjson")
     else:
         # APN not found in database, fall back to web scraping
         print(f"APN {request.apn} not found in database. Falling back to web scraping...")
@@ -327,3 +656,44 @@ async def get_parcel_details_and_explanation(request: APNRequest):
         # return the web scraping result in info availability format
         web_data["source"] = "webscraper"
         return web_data
+
+async def explain_parcel_data(parcel_data):
+    """Retrieves context and the full (non-streamed) explanation for one database parcel."""
+    query_text = f"Zoning and regulations for {parcel_data.get('SitusFullA', 'this area')}"
+    context = await retrieve_context(query_text)
+    explanation = "".join([delta async for delta in explain_parcel(parcel_data, context)])
+    return {
+        "parcel_data": parcel_data,
+        "context": context,
+        "explanation": explanation,
+        "source": "database"
+    }
+
+@app.post("/batch")
+async def get_parcels_batch(request: APNBatchRequest):
+    """Look up several APNs with a single database query and explain each hit, a few at a time.
+    APNs not in the database are scraped together over a single pooled browser."""
+    found = await parcel_batch_search(request.apns)
+    missing = [apn for apn in dict.fromkeys(request.apns) if apn not in found]
+
+    sem = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def bounded(apn, parcel_data):
+        async with sem:
+            try:
+                return await explain_parcel_data(parcel_data)
+            except Exception as e:
+                print(f"Error explaining APN {apn}: {e}")
+                return {"apn": apn, "parcel_data": parcel_data, "error": str(e), "source": "database"}
+
+    explained = await asyncio.gather(*(bounded(apn, parcel_data) for apn, parcel_data in found.items()))
+    results = dict(zip(found, explained))
+
+    if missing:
+        print(f"{len(missing)} APN(s) not found in database. Falling back to web scraping...")
+        scraped = await scrape_batch(missing)
+        for apn, web_data in zip(missing, scraped):
+            web_data["source"] = "webscraper"
+            results[apn] = web_data
+
+    return [results[apn] for apn in request.apns]